@@ -1,19 +1,17 @@
 import { NextResponse } from "next/server";
 import { YoutubeTranscript } from 'youtube-transcript';
 import { prisma } from "@/lib/prisma";
-import { extractVideoId, createSummaryPrompt } from '@/lib/youtube';
-import { GoogleGenerativeAI } from "@google/generative-ai";
-import { Groq } from "groq-sdk";
-import OpenAI from 'openai';
-import ytdl from 'ytdl-core';
+import { extractVideoId, createSummaryPrompt, SUMMARY_SYSTEM_PROMPT } from '@/lib/youtube';
+import type { GoogleGenerativeAI } from "@google/generative-ai";
+import type { Groq } from "groq-sdk";
+import type OpenAI from 'openai';
+import type ytdl from '@distube/ytdl-core';
 import fs from 'fs';
+import os from 'os';
 import path from 'path';
-import { exec } from 'child_process';
-import { promisify } from 'util';
-import FormData from 'form-data';
-import fetch from 'node-fetch';
-
-const execAsync = promisify(exec);
+import { spawn } from 'child_process';
+import { createHash } from 'crypto';
+import type { Readable } from 'stream';
 
 // Add at the top of the file after imports
 const logger = {
@@ -35,24 +33,47 @@ const logger = {
   }
 };
 
-// Initialize API clients only when needed
-function getGeminiClient() {
-  const apiKey = process.env.GEMINI_API_KEY;
+// API keys are read once when the route is loaded
+const GEMINI_API_KEY = process.env.GEMINI_API_KEY;
+const GROQ_API_KEY = process.env.GROQ_API_KEY;
+const OPENAI_API_KEY = process.env.OPENAI_API_KEY;
+
+// Initialize API clients only when needed and keep them for the server's lifetime
+let geminiClient: Promise<GoogleGenerativeAI> | undefined;
+let groqClient: Promise<Groq> | undefined;
+let openAIClient: Promise<OpenAI> | undefined;
+
+async function getGeminiClient() {
+  const apiKey = GEMINI_API_KEY;
   if (!apiKey) return null;
-  const genAI = new GoogleGenerativeAI(apiKey);
-  return genAI;
+  if (!geminiClient) {
+    geminiClient = import("@google/generative-ai").then(({ GoogleGenerativeAI }) => new GoogleGenerativeAI(apiKey));
+  }
+  return geminiClient;
 }
 
-function getGroqClient() {
-  const apiKey = process.env.GROQ_API_KEY;
+async function getGroqClient() {
+  const apiKey = GROQ_API_KEY;
   if (!apiKey) return null;
-  return new Groq({ apiKey });
+  if (!groqClient) {
+    groqClient = import("groq-sdk").then(({ Groq }) => new Groq({ apiKey }));
+  }
+  return groqClient;
 }
 
-function getOpenAIClient() {
-  const apiKey = process.env.OPENAI_API_KEY;
+async function getOpenAIClient() {
+  const apiKey = OPENAI_API_KEY;
   if (!apiKey) return null;
-  return new OpenAI({ apiKey });
+  if (!openAIClient) {
+    openAIClient = import('openai').then(({ default: OpenAI }) => new OpenAI({ apiKey }));
+  }
+  return openAIClient;
+}
+
+// ytdl is only needed for the Whisper fallback
+async function loadYtdl() {
+  const { default: ytdl } = await import('@distube/ytdl-core');
+  return ytdl;
 }
 
 // Helper function to get user-friendly model names
@@ -65,9 +86,9 @@ const MODEL_NAMES = {
 // Helper function to check API key availability
 function checkApiKeyAvailability() {
   return {
-    gemini: !!process.env.GEMINI_API_KEY,
-    groq: !!process.env.GROQ_API_KEY,
-    gpt4: !!process.env.OPENAI_API_KEY
+    gemini: !!GEMINI_API_KEY,
+    groq: !!GROQ_API_KEY,
+    gpt4: !!OPENAI_API_KEY
   };
 }
 
@@ -98,16 +119,67 @@ function cleanModelOutput(text: string): string {
     .trim();
 }
 
-// AI Model configuration
+// In-memory cache with a time-to-live and least-recently-used eviction
+function createCache<T>(ttlMs: number, maxEntries: number) {
+  const entries = new Map<string, { expiresAt: number; value: T }>();
+
+  return {
+    get(key: string): T | undefined {
+      const entry = entries.get(key);
+      if (!entry) return undefined;
+      if (entry.expiresAt <= Date.now()) {
+        entries.delete(key);
+        return undefined;
+      }
+      // Re-insert so the map stays ordered from least to most recently used
+      entries.delete(key);
+      entries.set(key, entry);
+      return entry.value;
+    },
+    set(key: string, value: T) {
+      const now = Date.now();
+      entries.delete(key);
+      entries.forEach((entry, existingKey) => {
+        if (entry.expiresAt <= now) entries.delete(existingKey);
+      });
+      while (entries.size >= maxEntries) {
+        const oldest = entries.keys().next().value;
+        if (oldest === undefined) break;
+        entries.delete(oldest);
+      }
+      entries.set(key, { expiresAt: now + ttlMs, value });
+    },
+    delete(key: string) {
+      entries.delete(key);
+    }
+  };
+}
+
+// Receives streamed text as it arrives from the model
+type DeltaHandler = (delta: string) => void | Promise<void>;
+
+// AI Model configuration; passing onDelta streams the response
 const AI_MODELS = {
   gemini: {
     name: "gemini",
-    async generateContent(prompt: string) {
-      const genAI = getGeminiClient();
+    async generateContent(prompt: string, onDelta?: DeltaHandler) {
+      const genAI = await getGeminiClient();
       if (!genAI) {
         throw new Error(`${MODEL_NAMES.gemini} API key is not configured. Please add your API key in the settings or choose a different model.`);
       }
       const model = genAI.getGenerativeModel({ model: "gemini-2.0-flash-001" });
+      if (onDelta) {
+        const result = await model.generateContentStream(prompt);
+        let text = '';
+        for await (const chunk of result.stream) {
+          const delta = chunk.text();
+          if (delta) {
+            text += delta;
+            await onDelta(delta);
+          }
+        }
+        return cleanModelOutput(text);
+      }
       const result = await model.generateContent(prompt);
       const response = await result.response;
       return cleanModelOutput(response.text());
@@ -116,73 +188,123 @@ const AI_MODELS = {
   groq: {
     name: "groq",
     model: "llama-3.3-70b-versatile",
-    async generateContent(prompt: string) {
-      const groq = getGroqClient();
+    async generateContent(prompt: string, onDelta?: DeltaHandler) {
+      const groq = await getGroqClient();
       if (!groq) {
         throw new Error(`${MODEL_NAMES.groq} API key is not configured. Please add your API key in the settings or choose a different model.`);
       }
-      const completion = await groq.chat.completions.create({
+      const request = {
         messages: [
           {
-            role: "system",
-            content: "You are a direct and concise summarizer. Respond only with the summary, without any prefixes or meta-commentary. Keep all markdown formatting intact."
+            role: "system" as const,
+            content: SUMMARY_SYSTEM_PROMPT
           },
           {
-            role: "user",
+            role: "user" as const,
             content: prompt
           }
         ],
         model: this.model,
         temperature: 0.7,
         max_tokens: 2048,
-      });
+      };
+      if (onDelta) {
+        const stream = await groq.chat.completions.create({ ...request, stream: true });
+        let text = '';
+        for await (const chunk of stream) {
+          const delta = chunk.choices[0]?.delta?.content || '';
+          if (delta) {
+            text += delta;
+            await onDelta(delta);
+          }
+        }
+        return cleanModelOutput(text);
+      }
+      const completion = await groq.chat.completions.create(request);
       return cleanModelOutput(completion.choices[0]?.message?.content || '');
     }
   },
   gpt4: {
     name: "gpt4",
     model: "gpt-4o-mini",
-    async generateContent(prompt: string) {
-      const openai = getOpenAIClient();
+    async generateContent(prompt: string, onDelta?: DeltaHandler) {
+      const openai = await getOpenAIClient();
       if (!openai) {
         throw new Error(`${MODEL_NAMES.gpt4} API key is not configured. Please add your API key in the settings or choose a different model.`);
       }
-      const completion = await openai.chat.completions.create({
+      const request = {
         messages: [
           {
-            role: "system",
-            content: "You are a direct and concise summarizer. Respond only with the summary, without any prefixes or meta-commentary. Keep all markdown formatting intact."
+            role: "system" as const,
+            content: SUMMARY_SYSTEM_PROMPT
           },
           {
-            role: "user",
+            role: "user" as const,
             content: prompt
           }
         ],
         model: this.model,
         temperature: 0.7,
         max_tokens: 2048,
-      });
+      };
+      if (onDelta) {
+        const stream = await openai.chat.completions.create({ ...request, stream: true });
+        let text = '';
+        for await (const chunk of stream) {
+          const delta = chunk.choices[0]?.delta?.content || '';
+          if (delta) {
+            text += delta;
+            await onDelta(delta);
+          }
+        }
+        return cleanModelOutput(text);
+      }
+      const completion = await openai.chat.completions.create(request);
       return cleanModelOutput(completion.choices[0]?.message?.content || '');
     }
   }
 };
 
-async function splitTranscriptIntoChunks(transcript: string, chunkSize: number = 7000, overlap: number = 1000): Promise<string[]> {
-  const words = transcript.split(' ');
+// Rough token estimate used to size chunks without shipping a tokenizer
+const CHARS_PER_TOKEN = 3;
+const CHUNK_TOKENS = 6000;
+const CHUNK_OVERLAP_TOKENS = 400;
+
+function estimateTokens(text: string): number {
+  return Math.ceil(text.length / CHARS_PER_TOKEN);
+}
+
+async function splitTranscriptIntoChunks(
+  transcript: string,
+  chunkTokens: number = CHUNK_TOKENS,
+  overlapTokens: number = CHUNK_OVERLAP_TOKENS
+): Promise<string[]> {
+  // Budgets in characters, matching how estimateTokens measures the whole transcript
+  const chunkChars = chunkTokens * CHARS_PER_TOKEN;
+  const overlapChars = overlapTokens * CHARS_PER_TOKEN;
+  const words = transcript.split(/\s+/).filter(Boolean);
   const chunks: string[] = [];
   let currentChunk: string[] = [];
+  // Length of the words joined with spaces, plus one for the next separator
   let currentLength = 0;
 
   for (const word of words) {
-    if (currentLength + word.length > chunkSize && currentChunk.length > 0) {
+    if (currentLength + word.length > chunkChars && currentChunk.length > 0) {
       chunks.push(currentChunk.join(' '));
-      // Keep last few words for overlap
-      const overlapWords = currentChunk.slice(-Math.floor(overlap / 10));
-      currentChunk = [...overlapWords];
-      currentLength = overlapWords.join(' ').length;
+      // Carry the trailing words over so context isn't lost at the boundary
+      const overlapWords: string[] = [];
+      let overlapLength = 0;
+      for (let i = currentChunk.length - 1; i >= 0; i--) {
+        const length = currentChunk[i].length + 1;
+        if (overlapLength + length > overlapChars) break;
+        overlapWords.unshift(currentChunk[i]);
+        overlapLength += length;
+      }
+      currentChunk = overlapWords;
+      currentLength = overlapLength;
     }
     currentChunk.push(word);
-    currentLength += word.length + 1; // +1 for space
+    currentLength += word.length + 1;
   }
 
   if (currentChunk.length > 0) {
@@ -192,218 +314,507 @@ async function splitTranscriptIntoChunks(transcript: string, chunkSize: number =
   return chunks;
 }
 
-async function downloadAudio(videoId: string): Promise<string> {
-  const tempPath = path.join('/tmp', `${videoId}_temp.mp3`);
-  const outputPath = path.join('/tmp', `${videoId}.flac`);
+// Maximum number of chunk summaries requested from the model at once
+const MAX_CONCURRENT_CHUNKS = Math.max(1, Number(process.env.MAX_CONCURRENT_CHUNKS) || 5);
 
-  try {
-    logger.info(`Starting audio download for video ${videoId}`);
+// Section summaries don't depend on the summary mode, so they're shared across modes
+const SECTION_SUMMARY_CACHE_TTL_MS = 24 * 60 * 60 * 1000;
+const SECTION_SUMMARY_CACHE_MAX_ENTRIES = 500;
+const sectionSummaryCache = createCache<string>(SECTION_SUMMARY_CACHE_TTL_MS, SECTION_SUMMARY_CACHE_MAX_ENTRIES);
 
-    // First download the audio
-    await new Promise<void>((resolve, reject) => {
-      const videoUrl = `https://www.youtube.com/watch?v=${videoId}`;
-      logger.debug(`Downloading from URL: ${videoUrl}`);
-
-      // Get video info first
-      ytdl.getInfo(videoUrl).then(info => {
-        logger.info('Video info retrieved:', {
-          title: info.videoDetails.title,
-          duration: info.videoDetails.lengthSeconds
-        });
+function sectionSummaryKey(section: string, language: string, model: string) {
+  return createHash('sha256').update(`${model}\0${language}\0${section}`).digest('hex');
+}
 
-        // Select the best audio format
-        const audioFormats = ytdl.filterFormats(info.formats, 'audioonly');
-        const format = audioFormats.sort((a, b) => {
-          // Prefer opus/webm formats
-          if (a.codecs?.includes('opus') && !b.codecs?.includes('opus')) return -1;
-          if (!a.codecs?.includes('opus') && b.codecs?.includes('opus')) return 1;
-          // Then sort by audio quality (bitrate)
-          return (b.audioBitrate || 0) - (a.audioBitrate || 0);
-        })[0];
-
-        if (!format) {
-          reject(new Error('No suitable audio format found'));
-          return;
-        }
+async function mapWithConcurrency<T, R>(
+  items: T[],
+  limit: number,
+  fn: (item: T, index: number) => Promise<R>
+): Promise<R[]> {
+  const results = new Array<R>(items.length);
+  let nextIndex = 0;
+  // Once one item fails, the other workers stop picking up new ones
+  let failed = false;
+
+  async function worker() {
+    while (!failed && nextIndex < items.length) {
+      const index = nextIndex++;
+      try {
+        results[index] = await fn(items[index], index);
+      } catch (error) {
+        failed = true;
+        throw error;
+      }
+    }
+  }
 
-        logger.info('Selected audio format:', {
-          container: format.container,
-          codec: format.codecs,
-          quality: format.quality,
-          bitrate: format.audioBitrate
-        });
+  await Promise.all(Array.from({ length: Math.min(limit, items.length) }, worker));
+  return results;
+}
 
-        const stream = ytdl.downloadFromInfo(info, { format });
+// Video metadata, shared by the title lookup and the audio download
+const VIDEO_INFO_TTL_MS = 60 * 60 * 1000;
+// Each entry holds the full player response, so only a handful are kept
+const VIDEO_INFO_CACHE_MAX_ENTRIES = 20;
+const videoInfoCache = createCache<Promise<ytdl.videoInfo>>(VIDEO_INFO_TTL_MS, VIDEO_INFO_CACHE_MAX_ENTRIES);
 
-        stream.on('error', (error) => {
-          logger.error('Error in ytdl stream:', {
-            error: error.message,
-            stack: error.stack,
-            videoId
-          });
-          reject(error);
-        });
+async function getVideoInfo(videoId: string): Promise<ytdl.videoInfo> {
+  const cached = videoInfoCache.get(videoId);
+  if (cached) {
+    return cached;
+  }
 
-        const writeStream = fs.createWriteStream(tempPath);
+  logger.info(`Fetching video info from YouTube for video ${videoId}`);
+  const ytdlClient = await loadYtdl();
+  const info = ytdlClient.getInfo(videoId).then((videoInfo) => {
+    logger.info('Video info retrieved:', {
+      title: videoInfo.videoDetails.title,
+      duration: videoInfo.videoDetails.lengthSeconds
+    });
+    return videoInfo;
+  }, (error) => {
+    videoInfoCache.delete(videoId);
+    logger.error('Failed to get video info:', {
+      error: error instanceof Error ? {
+        message: error.message,
+        stack: error.stack
+      } : error,
+      videoId
+    });
+    throw error;
+  });
+  videoInfoCache.set(videoId, info);
+  return info;
+}
 
-        writeStream.on('error', (error) => {
-          logger.error('Error in write stream:', {
-            error: error.message,
-            path: tempPath
-          });
-          reject(error);
-        });
+type DownloadedAudio = { buffer: Buffer; filename: string; mimeType: string };
+type AudioStream = { stream: Readable; filename: string; mimeType: string };
 
-        stream.pipe(writeStream)
-          .on('finish', () => {
-            const stats = fs.statSync(tempPath);
-            logger.info(`Audio download completed: ${tempPath}`, {
-              fileSize: stats.size
-            });
-            resolve();
-          })
-          .on('error', (error) => {
-            logger.error('Error during audio download:', {
-              error: error.message,
-              stack: error.stack
-            });
-            reject(error);
-          });
-      }).catch(error => {
-        logger.error('Failed to get video info:', {
-          error: error.message,
-          stack: error.stack,
-          videoId
-        });
-        reject(error);
-      });
-    });
+// Starts downloading the smallest audio-only format of a video
+async function openAudioStream(videoId: string): Promise<AudioStream> {
+  logger.info(`Starting audio download for video ${videoId}`);
 
-    // Verify the temp file exists and has content
-    const tempStats = fs.statSync(tempPath);
-    if (tempStats.size === 0) {
-      throw new Error('Downloaded audio file is empty');
-    }
-    logger.info('Temp file verification:', {
-      size: tempStats.size,
-      path: tempPath
+  const ytdl = await loadYtdl();
+  const info = await getVideoInfo(videoId);
+
+  // Select the smallest audio format
+  const audioFormats = ytdl.filterFormats(info.formats, 'audioonly');
+  const format = audioFormats.sort((a, b) => {
+    // Prefer opus/webm formats
+    if (a.codecs?.includes('opus') && !b.codecs?.includes('opus')) return -1;
+    if (!a.codecs?.includes('opus') && b.codecs?.includes('opus')) return 1;
+    // Then sort by audio bitrate, lowest first
+    return (a.audioBitrate || 0) - (b.audioBitrate || 0);
+  })[0];
+
+  if (!format) {
+    throw new Error('No suitable audio format found');
+  }
+
+  logger.info('Selected audio format:', {
+    container: format.container,
+    codec: format.codecs,
+    quality: format.quality,
+    bitrate: format.audioBitrate
+  });
+
+  const stream = ytdl.downloadFromInfo(info, { format });
+  stream.on('error', (error) => {
+    logger.error('Error in ytdl stream:', {
+      error: error.message,
+      stack: error.stack,
+      videoId
     });
+  });
 
-    // Convert to optimal format for Whisper
-    logger.info('Converting audio to FLAC format...');
-    try {
-      const { stdout, stderr } = await execAsync(`ffmpeg -i ${tempPath} -ar 16000 -ac 1 -c:a flac ${outputPath}`);
-      logger.debug('FFmpeg output:', { stdout, stderr });
-    } catch (error: any) {
-      logger.error('FFmpeg conversion failed:', {
-        error: error.message,
-        stdout: error.stdout,
-        stderr: error.stderr
+  return {
+    stream,
+    filename: `audio.${format.container}`,
+    mimeType: format.mimeType?.split(';')[0] || `audio/${format.container}`
+  };
+}
+
+async function downloadAudio(videoId: string): Promise<DownloadedAudio> {
+  try {
+    const { stream, filename, mimeType } = await openAudioStream(videoId);
+
+    // Only used when ffmpeg isn't installed; the original container is uploaded as is
+    const chunks: Buffer[] = [];
+    await new Promise<void>((resolve, reject) => {
+      stream.on('data', (chunk: Buffer) => {
+        chunks.push(chunk);
       });
-      throw error;
-    }
+      stream.on('end', () => resolve());
+      stream.on('error', reject);
+    });
 
-    // Verify the output file
-    const stats = fs.statSync(outputPath);
-    if (stats.size === 0) {
-      throw new Error('Converted FLAC file is empty');
+    const buffer = Buffer.concat(chunks);
+    if (buffer.length === 0) {
+      throw new Error('Downloaded audio is empty');
     }
-    logger.info('Audio conversion completed successfully:', {
-      inputSize: tempStats.size,
-      outputSize: stats.size,
-      outputPath
+    logger.info('Audio download completed successfully:', {
+      size: buffer.length,
+      filename
     });
 
-    // Clean up temp file
-    fs.unlinkSync(tempPath);
-    logger.info('Temporary MP3 file cleaned up');
-
-    return outputPath;
+    return { buffer, filename, mimeType };
   } catch (error) {
     logger.error('Error in downloadAudio:', {
       error: error instanceof Error ? {
         message: error.message,
         stack: error.stack
       } : error,
-      videoId,
-      tempPath,
-      outputPath
+      videoId
     });
-    // Clean up any files in case of error
-    if (fs.existsSync(tempPath)) {
-      try {
-        fs.unlinkSync(tempPath);
-        logger.info('Cleaned up temp MP3 file after error');
-      } catch (cleanupError) {
-        logger.error('Failed to cleanup temp MP3 file:', cleanupError);
+    throw error;
+  }
+}
+
+// Opens the connection to OpenAI early so the first Whisper upload finds it ready
+function warmOpenAIConnection() {
+  getOpenAIClient()
+    .then(openai => openai?.models.list())
+    .catch((error) => {
+      logger.debug('OpenAI connection warmup failed:', { error: error?.message });
+    });
+}
+
+async function transcribeWithWhisper(audio: DownloadedAudio): Promise<string> {
+  logger.info('Starting transcription process with OpenAI Whisper');
+  logger.debug('Input audio details:', {
+    size: audio.buffer.length,
+    filename: audio.filename,
+    mimeType: audio.mimeType
+  });
+
+  const openai = await getOpenAIClient();
+  if (!openai) {
+    throw new Error('OpenAI API key not configured for Whisper transcription.');
+  }
+
+  try {
+    logger.info('Sending request to OpenAI Whisper API...');
+    // Language is left out so Whisper detects it from the audio
+    const transcription = await openai.audio.transcriptions.create({
+      file: new File([audio.buffer], audio.filename, { type: audio.mimeType }),
+      model: 'whisper-1',
+      response_format: 'text'
+    });
+
+    logger.info('Successfully received transcription from Whisper');
+    return transcription.trim();
+
+  } catch (error: any) {
+    logger.error('Transcription request failed:', error);
+    // Keep the SDK error as the cause so its status code can decide on retries
+    throw new Error(`Whisper transcription failed: ${error.message || 'Unknown error'}`, { cause: error });
+  }
+}
+
+// Long recordings are split into segments that are transcribed in parallel
+const AUDIO_SEGMENT_SECONDS = 600;
+
+// Whisper works on 16 kHz mono audio, so nothing more is uploaded
+const WHISPER_AUDIO_ARGS = ['-vn', '-ac', '1', '-ar', '16000', '-c:a', 'libopus', '-b:a', '24k'];
+const MAX_CONCURRENT_TRANSCRIPTIONS = 5;
+
+function createConcurrencyLimiter(limit: number) {
+  let active = 0;
+  const waiting: (() => void)[] = [];
+
+  return async function run<T>(task: () => Promise<T>): Promise<T> {
+    if (active >= limit) {
+      // The finishing task hands its slot over directly
+      await new Promise<void>(resolve => waiting.push(resolve));
+    } else {
+      active++;
+    }
+
+    try {
+      return await task();
+    } finally {
+      const next = waiting.shift();
+      if (next) {
+        next();
+      } else {
+        active--;
       }
     }
-    if (fs.existsSync(outputPath)) {
-      try {
-        fs.unlinkSync(outputPath);
-        logger.info('Cleaned up FLAC file after error');
-      } catch (cleanupError) {
-        logger.error('Failed to cleanup FLAC file:', cleanupError);
+  };
+}
+
+// One Whisper upload queue shared by all requests
+const whisperQueue = createConcurrencyLimiter(MAX_CONCURRENT_TRANSCRIPTIONS);
+
+// Pipes the download through ffmpeg and uploads each segment as soon as it's written
+async function transcribeInSegments(videoId: string): Promise<string> {
+  const { stream } = await openAudioStream(videoId);
+  const segmentDir = await fs.promises.mkdtemp(path.join(os.tmpdir(), 'audio-segments-'));
+  const transcriptions: Promise<string>[] = [];
+  // Set once the transcript can't be completed, so queued segments are skipped
+  let failed = false;
+
+  const queueSegment = (file: string) => {
+    const index = transcriptions.length;
+    const transcription = transcribeSegment(() => whisperQueue(async () => {
+      if (failed) {
+        throw new Error('Transcription cancelled');
       }
+      const buffer = await fs.promises.readFile(path.join(segmentDir, file));
+      return transcribeWithWhisper({ buffer, filename: file, mimeType: 'audio/ogg' });
+    }), index);
+    // Failures are collected below once all segments are queued
+    transcription.catch(() => {});
+    transcriptions.push(transcription);
+  };
+
+  try {
+    await new Promise<void>((resolve, reject) => {
+      const ffmpeg = spawn('ffmpeg', [
+        '-loglevel', 'error',
+        '-i', 'pipe:0',
+        ...WHISPER_AUDIO_ARGS,
+        '-f', 'segment',
+        '-segment_time', String(AUDIO_SEGMENT_SECONDS),
+        '-segment_list', 'pipe:1',
+        '-segment_list_type', 'flat',
+        path.join(segmentDir, 'segment_%03d.ogg')
+      ]);
+      let stderr = '';
+      let segmentList = '';
+
+      ffmpeg.stdout.on('data', (data) => {
+        segmentList += data;
+        const lines = segmentList.split('\n');
+        segmentList = lines.pop() || '';
+        for (const line of lines) {
+          if (line.trim()) {
+            queueSegment(path.basename(line.trim()));
+          }
+        }
+      });
+
+      ffmpeg.stderr.on('data', (data) => {
+        stderr += data;
+      });
+
+      ffmpeg.on('error', (error) => {
+        stream.destroy();
+        reject(error);
+      });
+
+      ffmpeg.on('close', (code) => {
+        if (code === 0) {
+          if (segmentList.trim()) {
+            queueSegment(path.basename(segmentList.trim()));
+          }
+          resolve();
+        } else {
+          stream.destroy();
+          reject(new Error(`FFmpeg exited with code ${code}: ${stderr.trim() || 'no error output'}`));
+        }
+      });
+
+      // FFmpeg closes stdin early when it fails; the exit code is reported above
+      ffmpeg.stdin.on('error', (error) => {
+        logger.debug('FFmpeg input closed:', { error: error.message });
+      });
+
+      stream.on('error', (error) => {
+        ffmpeg.kill();
+        reject(error);
+      });
+
+      stream.pipe(ffmpeg.stdin);
+    });
+
+    logger.info(`Split audio into ${transcriptions.length} segments`);
+    if (transcriptions.length === 0) {
+      throw new Error('No audio segments were produced');
+    }
+    const parts = await Promise.all(transcriptions);
+    const transcript = parts.join(' ').trim();
+    if (!transcript) {
+      throw new Error('Whisper returned an empty transcript');
     }
+    return transcript;
+  } catch (error) {
+    failed = true;
     throw error;
+  } finally {
+    // Let in-flight uploads finish reading their files before removing them
+    await Promise.allSettled(transcriptions);
+    await fs.promises.rm(segmentDir, { recursive: true, force: true }).catch((error) => {
+      logger.error('Failed to clean up audio segments:', error);
+    });
   }
 }
 
-async function transcribeWithWhisper(audioPath: string): Promise<string> {
+async function transcribeAudio(videoId: string): Promise<string> {
   try {
-    logger.info('Starting transcription process with OpenAI Whisper');
+    return await transcribeInSegments(videoId);
+  } catch (error) {
+    // Without ffmpeg installed, fall back to uploading the original audio
+    if ((error as NodeJS.ErrnoException)?.code !== 'ENOENT') {
+      throw error;
+    }
+    logger.error('FFmpeg not available, transcribing the audio in one request:', error);
+  }
 
-    // Verify input file
-    const inputStats = fs.statSync(audioPath);
-    logger.debug('Input file details:', {
-      size: inputStats.size,
-      path: audioPath
-    });
+  const audio = await downloadAudio(videoId);
+  return whisperQueue(() => transcribeWithWhisper(audio));
+}
 
-    const openai = getOpenAIClient();
-    if (!openai) {
-      throw new Error('OpenAI API key not configured for Whisper transcription.');
+const SEGMENT_RETRY_DELAY_MS = 1000;
+
+// Rate limits, server errors and dropped connections are worth another try
+function isRetryableWhisperError(error: unknown): boolean {
+  const cause = error instanceof Error ? error.cause : undefined;
+  const status = (cause as { status?: number } | undefined)?.status;
+  if (typeof status === 'number') {
+    return status === 429 || status >= 500;
+  }
+  return isNetworkError(cause) ||
+    (cause instanceof Error && /timed out/i.test(cause.message));
+}
+
+// Each segment gets one retry; the delay is spent outside the Whisper queue
+async function transcribeSegment(upload: () => Promise<string>, index: number): Promise<string> {
+  try {
+    return await upload();
+  } catch (error) {
+    if (!isRetryableWhisperError(error)) {
+      throw error;
     }
+    const delay = SEGMENT_RETRY_DELAY_MS + Math.random() * SEGMENT_RETRY_DELAY_MS;
+    logger.info(`Transcription of segment ${index + 1} failed, retrying in ${Math.round(delay)}ms`, {
+      error: error instanceof Error ? error.message : String(error)
+    });
+    await new Promise(resolve => setTimeout(resolve, delay));
+    return upload();
+  }
+}
 
-    // Read file as buffer
-    const audioBuffer = await fs.promises.readFile(audioPath);
-    logger.info(`Read audio file of size: ${audioBuffer.length} bytes`);
+const TRANSCRIPT_FETCH_ATTEMPTS = 4;
+const TRANSCRIPT_RETRY_BASE_DELAY_MS = 1000;
+const TRANSCRIPT_RETRY_MAX_DELAY_MS = 30000;
 
-    try {
-      logger.info('Sending request to OpenAI Whisper API...');
-      const transcription = await openai.audio.transcriptions.create({
-        file: new File([audioBuffer], 'audio.flac', { type: 'audio/flac' }),
-        model: 'whisper-1',
-        language: 'auto'
-      });
+// youtube-transcript's error classes don't survive instanceof, so match messages
+function isRateLimitError(error: unknown): boolean {
+  return error instanceof Error && /too many requests/i.test(error.message);
+}
 
-      logger.info('Successfully received transcription from Whisper');
-      return transcription.text;
+// fetch() rejects with a TypeError whose cause carries the socket error code
+const RETRYABLE_NETWORK_CODES = new Set([
+  'ECONNRESET',
+  'ECONNREFUSED',
+  'ETIMEDOUT',
+  'EAI_AGAIN',
+  'EPIPE',
+  'UND_ERR_SOCKET',
+  'UND_ERR_CONNECT_TIMEOUT',
+  'UND_ERR_HEADERS_TIMEOUT'
+]);
+
+function isNetworkError(error: unknown): boolean {
+  if (!(error instanceof Error)) return false;
+  const code = (error as NodeJS.ErrnoException).code ??
+    ((error.cause as NodeJS.ErrnoException | undefined)?.code);
+  return (code !== undefined && RETRYABLE_NETWORK_CODES.has(code)) ||
+    (error instanceof TypeError && /fetch failed/i.test(error.message));
+}
 
-    } catch (error: any) {
-      logger.error('Transcription request failed:', error);
-      throw new Error(`Whisper transcription failed: ${error.message || 'Unknown error'}`);
-    }
-  } finally {
-    // Cleanup: Delete the temporary audio file
+// Retries rate limits and network failures with exponential backoff and jitter
+async function fetchTranscriptWithRetry(videoId: string) {
+  for (let attempt = 1; ; attempt++) {
     try {
-      await fs.promises.unlink(audioPath);
-      logger.info('Cleaned up temporary audio file');
+      return await YoutubeTranscript.fetchTranscript(videoId);
     } catch (error) {
-      logger.error('Failed to delete temporary audio file:', error);
+      const isTransient = isRateLimitError(error) || isNetworkError(error);
+      if (!isTransient || attempt >= TRANSCRIPT_FETCH_ATTEMPTS) {
+        throw error;
+      }
+
+      const delay = Math.min(
+        TRANSCRIPT_RETRY_BASE_DELAY_MS * Math.pow(2, attempt - 1),
+        TRANSCRIPT_RETRY_MAX_DELAY_MS
+      ) + Math.random() * TRANSCRIPT_RETRY_BASE_DELAY_MS;
+      logger.info(`Transcript fetch attempt ${attempt} failed, retrying in ${Math.round(delay)}ms`, {
+        error: error instanceof Error ? error.message : String(error)
+      });
+      await new Promise(resolve => setTimeout(resolve, delay));
     }
   }
 }
 
-async function getTranscript(videoId: string): Promise<{ transcript: string; source: 'youtube' | 'whisper'; title: string }> {
+type TranscriptResult = { transcript: string; source: 'youtube' | 'whisper'; title: string };
+
+// In-flight transcript fetches, shared by concurrent requests for the same video
+const pendingTranscripts = new Map<string, Promise<TranscriptResult>>();
+
+async function getCachedTranscript(videoId: string): Promise<TranscriptResult> {
+  const pending = pendingTranscripts.get(videoId);
+  if (pending) {
+    logger.info(`Waiting for in-flight transcript of video ${videoId}`);
+    return pending;
+  }
+
+  const transcript = loadTranscript(videoId).finally(() => {
+    pendingTranscripts.delete(videoId);
+  });
+  pendingTranscripts.set(videoId, transcript);
+  return transcript;
+}
+
+// Transcripts don't change for a given video, so they are stored in the database
+async function loadTranscript(videoId: string): Promise<TranscriptResult> {
+  const stored = await prisma.transcript.findUnique({
+    where: { videoId }
+  }).catch((dbError) => {
+    logger.error('Failed to read stored transcript:', dbError);
+    return null;
+  });
+
+  if (stored) {
+    logger.info(`Using stored transcript for video ${videoId}`);
+    return {
+      transcript: stored.content,
+      source: stored.source as TranscriptResult['source'],
+      title: stored.title
+    };
+  }
+
+  const value = await getTranscript(videoId);
+  await prisma.transcript.upsert({
+    where: { videoId },
+    create: {
+      videoId,
+      title: value.title,
+      content: value.transcript,
+      source: value.source
+    },
+    update: {
+      title: value.title,
+      content: value.transcript,
+      source: value.source
+    }
+  }).catch((dbError) => {
+    // The summary can still be generated without the stored copy
+    logger.error('Failed to store transcript:', dbError);
+  });
+
+  return value;
+}
+
+async function getTranscript(videoId: string): Promise<TranscriptResult> {
   try {
     logger.info(`Attempting to fetch YouTube transcript for video ${videoId}`);
     // First try YouTube transcripts
-    const transcriptList = await YoutubeTranscript.fetchTranscript(videoId);
+    const transcriptList = await fetchTranscriptWithRetry(videoId);
 
     // Extract title and process transcript as before
-    const firstFewLines = transcriptList.slice(0, 5).map(item => item.text).join(' ');
+    const lines = transcriptList.map(item => item.text);
+    const firstFewLines = lines.slice(0, 5).join(' ');
     let title = firstFewLines.split('.')[0].trim();
 
     if (title.length > 100) {
@@ -421,28 +832,26 @@ async function getTranscript(videoId: string): Promise<{ transcript: string; sou
     });
 
     return {
-      transcript: transcriptList.map(item => item.text).join(' '),
+      transcript: lines.join(' '),
       source: 'youtube',
       title
     };
   } catch (error) {
+    // Still rate limited after retrying, so the audio download would be too
+    if (isRateLimitError(error)) {
+      logger.error('YouTube is rate limiting transcript requests', error);
+      throw new Error('YouTube is rate limiting requests right now. Please try again in a few minutes.');
+    }
+
     logger.info('YouTube transcript not available, falling back to Whisper...', {
       error: error instanceof Error ? error.message : String(error)
     });
 
+    warmOpenAIConnection();
+
     try {
       // Get video info for title
-      logger.info('Fetching video info from YouTube');
-      const videoInfo = await ytdl.getInfo(videoId).catch(infoError => {
-        logger.error('Failed to get video info:', {
-          error: infoError instanceof Error ? {
-            message: infoError.message,
-            stack: infoError.stack
-          } : infoError,
-          videoId
-        });
-        throw infoError;
-      });
+      const videoInfo = await getVideoInfo(videoId);
 
       const title = videoInfo.videoDetails.title;
       logger.info('Video info retrieved successfully:', {
@@ -452,8 +861,7 @@ async function getTranscript(videoId: string): Promise<{ transcript: string; sou
       });
 
       // Check if OpenAI API is available
-      const openai = getOpenAIClient();
-      if (!openai) {
+      if (!OPENAI_API_KEY) {
         const error = 'Transcript not available and OpenAI API key not configured for Whisper fallback.';
         logger.error(error, { message: error });
         throw new Error(error);
@@ -461,13 +869,7 @@ async function getTranscript(videoId: string): Promise<{ transcript: string; sou
 
       // Download and transcribe
       try {
-        const audioPath = await downloadAudio(videoId);
-        logger.info('Audio downloaded successfully', {
-          path: audioPath,
-          fileStats: fs.statSync(audioPath)
-        });
-
-        const transcript = await transcribeWithWhisper(audioPath);
+        const transcript = await transcribeAudio(videoId);
         logger.info('Transcription completed successfully', {
           transcriptLength: transcript.length
         });
@@ -507,8 +909,17 @@ export async function POST(req: Request) {
   const stream = new TransformStream();
   const writer = stream.writable.getWriter();
 
+  // Progress is best effort, a client that has gone away just stops receiving it
   const writeProgress = async (data: any) => {
-    await writer.write(encoder.encode(JSON.stringify(data) + '\n'));
+    if (req.signal.aborted) return;
+    await writer.write(encoder.encode(JSON.stringify(data) + '\n')).catch(() => {});
+  };
+
+  // Checked before each model call so no new work starts for a departed client
+  const throwIfDisconnected = () => {
+    if (req.signal.aborted) {
+      throw new Error('Client disconnected');
+    }
   };
 
   (async () => {
@@ -531,11 +942,9 @@ export async function POST(req: Request) {
       logger.info(`Using ${MODEL_NAMES[aiModel as keyof typeof MODEL_NAMES]} model for generation...`);
 
       // Check cache first
+      const cacheKey = { videoId, language, mode };
       const existingSummary = await prisma.summary.findFirst({
-        where: {
-          videoId,
-          language
-        }
+        where: cacheKey
       });
 
       if (existingSummary) {
@@ -558,33 +967,50 @@ export async function POST(req: Request) {
         message: 'Fetching video transcript...'
       });
 
-      const { transcript, source, title } = await getTranscript(videoId);
-      const chunks = await splitTranscriptIntoChunks(transcript);
+      const { transcript, source, title } = await getCachedTranscript(videoId);
+      // Single pass or per-section summaries, based on the transcript's size
+      const transcriptTokens = estimateTokens(transcript);
+      const chunks = transcriptTokens > CHUNK_TOKENS
+        ? await splitTranscriptIntoChunks(transcript)
+        : [transcript];
       const totalChunks = chunks.length;
-      const intermediateSummaries = [];
-
-      // Process chunks
-      for (let i = 0; i < chunks.length; i++) {
-        await writeProgress({
-          type: 'progress',
-          currentChunk: i + 1,
-          totalChunks,
-          stage: 'processing',
-          message: `Processing section ${i + 1} of ${totalChunks}...`
+      logger.info('Transcript size:', { estimatedTokens: transcriptTokens, chunks: totalChunks });
+
+      // A transcript that fits in a single chunk goes straight into the final prompt
+      let textToSummarize = transcript;
+      if (chunks.length > 1) {
+        // Process chunks concurrently, results keep the original section order
+        let completedChunks = 0;
+        const intermediateSummaries = await mapWithConcurrency(chunks, MAX_CONCURRENT_CHUNKS, async (chunk, i) => {
+          const prompt = `Create a detailed summary of section ${i + 1} in ${language}.
+          Maintain all important information, arguments, and connections.
+          Pay special attention to:
+          - Main topics and arguments
+          - Important details and examples
+          - Connections with other mentioned topics
+          - Key statements and conclusions
+
+          Text: ${chunk}`;
+
+          const key = sectionSummaryKey(chunk, language, selectedModel.name);
+          let text = sectionSummaryCache.get(key);
+          if (text === undefined) {
+            throwIfDisconnected();
+            text = await selectedModel.generateContent(prompt);
+            sectionSummaryCache.set(key, text);
+          }
+          completedChunks++;
+          await writeProgress({
+            type: 'progress',
+            currentChunk: completedChunks,
+            totalChunks,
+            stage: 'processing',
+            message: `Processed section ${completedChunks} of ${totalChunks}...`
+          });
+          return text;
         });
 
-        const prompt = `Create a detailed summary of section ${i + 1} in ${language}.
-        Maintain all important information, arguments, and connections.
-        Pay special attention to:
-        - Main topics and arguments
-        - Important details and examples
-        - Connections with other mentioned topics
-        - Key statements and conclusions
-
-        Text: ${chunks[i]}`;
-
-        const text = await selectedModel.generateContent(prompt);
-        intermediateSummaries.push(text);
+        textToSummarize = intermediateSummaries.join('\n\n=== Next Section ===\n\n');
       }
 
       // Generate final summary
@@ -596,9 +1022,12 @@ export async function POST(req: Request) {
         message: 'Creating final summary...'
       });
 
-      const combinedSummary = intermediateSummaries.join('\n\n=== Next Section ===\n\n');
-      const finalPrompt = createSummaryPrompt(combinedSummary, language, mode);
-      const summary = await selectedModel.generateContent(finalPrompt);
+      throwIfDisconnected();
+      const finalPrompt = createSummaryPrompt(textToSummarize, language, mode);
+      // Stream the final summary so the page can render it while it's generated
+      const summary = await selectedModel.generateContent(finalPrompt, (delta) =>
+        writeProgress({ type: 'delta', text: delta })
+      );
 
       if (!summary) {
         throw new Error('No summary content generated');
@@ -616,10 +1045,7 @@ export async function POST(req: Request) {
       try {
         // Check if summary already exists
         const existingSummary = await prisma.summary.findFirst({
-          where: {
-            videoId,
-            language
-          }
+          where: cacheKey
         });
 
         let savedSummary;
@@ -670,6 +1096,13 @@ export async function POST(req: Request) {
       }
 
     } catch (error: any) {
+      if (req.signal.aborted) {
+        logger.info('Client disconnected, stopped processing video', {
+          error: error?.message
+        });
+        return;
+      }
+
       logger.error('Error processing video:', {
         error,
         stack: error?.stack,
@@ -680,12 +1113,12 @@ export async function POST(req: Request) {
         type: 'error',
         error: error?.message || 'Failed to process video',
         details: error?.toString() || 'Unknown error'
-      }).catch((writeError) => {
-        logger.error('Failed to write error progress:', writeError);
       });
     } finally {
       await writer.close().catch((closeError) => {
-        logger.error('Failed to close writer:', closeError);
+        if (!req.signal.aborted) {
+          logger.error('Failed to close writer:', closeError);
+        }
       });
     }
   })();
@@ -47,10 +47,16 @@ export default function SummaryPage({ params }: PageProps) {
   const { videoUrl } = use(params)
 
   useEffect(() => {
+    // Abort the request when the inputs change or the page unmounts, so a
+    // re-run of this effect doesn't leave a second summarization running
+    const controller = new AbortController()
+
     const fetchSummary = async () => {
       try {
         setLoading(true)
         setError(null)
+        setSummary("")
+        setSource(null)
 
         const url = urlSafeBase64Decode(videoUrl)
         const response = await fetch("/api/summarize", {
@@ -64,6 +70,7 @@ export default function SummaryPage({ params }: PageProps) {
             mode,
             aiModel
           }),
+          signal: controller.signal,
         })
 
         if (!response.ok) {
@@ -76,40 +83,68 @@ export default function SummaryPage({ params }: PageProps) {
           throw new Error("Failed to read response stream")
         }
 
+        // Messages are newline-delimited JSON; a single read can carry several
+        // messages or end in the middle of one, so buffer until each newline
         const decoder = new TextDecoder()
-        while (true) {
-          const { done, value } = await reader.read()
-          if (done) break
-
-          const chunk = decoder.decode(value)
-          try {
-            const data = JSON.parse(chunk)
-
-            if (data.type === 'progress') {
-              setStatus({
-                currentChunk: data.currentChunk,
-                totalChunks: data.totalChunks,
-                stage: data.stage,
-                message: data.message
-              })
-            } else if (data.type === 'complete') {
-              setSummary(data.summary)
-              setSource(data.source)
-              break
+        let buffer = ""
+        let done = false
+        while (!done) {
+          const result = await reader.read()
+          if (result.done) break
+
+          buffer += decoder.decode(result.value, { stream: true })
+          const lines = buffer.split("\n")
+          buffer = lines.pop() || ""
+
+          for (const line of lines) {
+            if (!line.trim()) continue
+            try {
+              const data = JSON.parse(line)
+
+              if (data.type === 'progress') {
+                setStatus({
+                  currentChunk: data.currentChunk,
+                  totalChunks: data.totalChunks,
+                  stage: data.stage,
+                  message: data.message
+                })
+              } else if (data.type === 'delta') {
+                setSummary((current) => current + data.text)
+              } else if (data.type === 'complete') {
+                setSummary(data.summary)
+                setSource(data.source)
+                done = true
+                break
+              } else if (data.type === 'error') {
+                // Don't leave a partially streamed summary looking finished
+                setError(data.error)
+                done = true
+                break
+              }
+            } catch (e) {
+              console.error('Error parsing chunk:', e)
             }
-          } catch (e) {
-            console.error('Error parsing chunk:', e)
           }
         }
+
+        if (!done) {
+          // The stream ended before the summary was complete
+          setError("The connection was interrupted before the summary was finished")
+        }
       } catch (err) {
+        if (controller.signal.aborted) return
         console.error("Error fetching summary:", err)
         setError(err instanceof Error ? err.message : "An error occurred while generating the summary")
       } finally {
-        setLoading(false)
+        if (!controller.signal.aborted) {
+          setLoading(false)
+        }
       }
     }
 
     fetchSummary()
+
+    return () => controller.abort()
   }, [videoUrl, languageCode, mode, aiModel])
 
   const displayLanguage =
@@ -137,7 +172,8 @@ export default function SummaryPage({ params }: PageProps) {
     }
   }
 
-  if (loading) {
+  // Once the final summary starts streaming in, show it instead of the progress card
+  if (loading && !summary) {
     const progress = status.totalChunks ? (status.currentChunk / status.totalChunks) * 100 : 0
 
     return (
@@ -218,7 +254,7 @@ export default function SummaryPage({ params }: PageProps) {
         <CardContent>
           {error && <div className="bg-destructive/15 text-destructive px-4 py-3 rounded-md">{error}</div>}
 
-          {!loading && !error && (
+          {!error && (
             <div className="prose prose-sm sm:prose lg:prose-lg max-w-none dark:prose-invert">
               <ReactMarkdown>{summary}</ReactMarkdown>
             </div>
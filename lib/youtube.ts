@@ -1,19 +1,11 @@
+// Matches standard, shared, embed, youtu.be and Shorts URLs (the ID follows
+// `v=` or a path segment), or a bare 11-character video ID
+const VIDEO_ID_PATTERN = /(?:v=|\/)([0-9A-Za-z_-]{11})|^([0-9A-Za-z_-]{11})$/;
+
 export function extractVideoId(youtube_url: string): string {
-  const patterns = [
-    /(?:v=|\/)([0-9A-Za-z_-]{11}).*/,      // Standard and shared URLs
-    /(?:embed\/)([0-9A-Za-z_-]{11})/,       // Embed URLs
-    /(?:youtu\.be\/)([0-9A-Za-z_-]{11})/,   // Shortened URLs
-    /(?:shorts\/)([0-9A-Za-z_-]{11})/,      // YouTube Shorts
-    /^([0-9A-Za-z_-]{11})$/                 // Just the video ID
-  ];
-
-  const url = youtube_url.trim();
-
-  for (const pattern of patterns) {
-    const match = url.match(pattern);
-    if (match) {
-      return match[1];
-    }
+  const match = youtube_url.trim().match(VIDEO_ID_PATTERN);
+  if (match) {
+    return match[1] || match[2];
   }
 
   throw new Error("Could not extract video ID from URL");
@@ -24,25 +16,28 @@ export const AVAILABLE_LANGUAGES = {
   'German': 'de'
 } as const;
 
+// Section headings used in the summary prompt, per target language
+const SECTION_LABELS = {
+  'en': {
+    title: 'TITLE',
+    overview: 'OVERVIEW',
+    keyPoints: 'KEY POINTS',
+    takeaways: 'MAIN TAKEAWAYS',
+    context: 'CONTEXT & IMPLICATIONS'
+  },
+  'de': {
+    title: 'TITEL',
+    overview: 'ÜBERBLICK',
+    keyPoints: 'KERNPUNKTE',
+    takeaways: 'HAUPTERKENNTNISSE',
+    context: 'KONTEXT & AUSWIRKUNGEN'
+  }
+} as const;
+
+export const SUMMARY_SYSTEM_PROMPT = "You are a direct and concise summarizer. Respond only with the summary, without any prefixes or meta-commentary. Keep all markdown formatting intact.";
+
 export function createSummaryPrompt(text: string, targetLanguage: string, mode: 'video' | 'podcast' = 'video') {
-  const languagePrompts = {
-    'en': {
-      title: 'TITLE',
-      overview: 'OVERVIEW',
-      keyPoints: 'KEY POINTS',
-      takeaways: 'MAIN TAKEAWAYS',
-      context: 'CONTEXT & IMPLICATIONS'
-    },
-    'de': {
-      title: 'TITEL',
-      overview: 'ÜBERBLICK',
-      keyPoints: 'KERNPUNKTE',
-      takeaways: 'HAUPTERKENNTNISSE',
-      context: 'KONTEXT & AUSWIRKUNGEN'
-    }
-  };
-
-  const prompts = languagePrompts[targetLanguage as keyof typeof languagePrompts] || languagePrompts.en;
+  const prompts = SECTION_LABELS[targetLanguage as keyof typeof SECTION_LABELS] || SECTION_LABELS.en;
 
   if (mode === 'podcast') {
     return `Please provide a detailed podcast-style summary of the following content in ${targetLanguage}.
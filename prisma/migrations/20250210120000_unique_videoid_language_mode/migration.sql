@@ -0,0 +1,5 @@
+-- DropIndex
+DROP INDEX "Summary_videoId_language_key";
+
+-- CreateIndex
+CREATE UNIQUE INDEX "Summary_videoId_language_mode_key" ON "Summary"("videoId", "language", "mode");
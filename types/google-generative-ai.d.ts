@@ -6,6 +6,7 @@ declare module '@google/generative-ai' {
 
   export interface GenerativeModel {
     generateContent(prompt: string): Promise<GenerateContentResult>;
+    generateContentStream(prompt: string): Promise<GenerateContentStreamResult>;
   }
 
   export interface GenerateContentResult {
@@ -13,4 +14,13 @@ declare module '@google/generative-ai' {
       text(): string;
     };
   }
+
+  export interface GenerateContentStreamResult {
+    stream: AsyncIterable<{
+      text(): string;
+    }>;
+    response: Promise<{
+      text(): string;
+    }>;
+  }
 }
\ No newline at end of file